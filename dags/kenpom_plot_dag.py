@@ -8,11 +8,6 @@ from airflow.utils.dates import days_ago
 from datetime import timedelta
 import os
 
-# In Astro, the include folder is automatically added to PYTHONPATH
-# So we can directly import from kenpom_plot
-from kenpom_plot import main
-
-
 # Default arguments for the DAG
 default_args = {
     'owner': 'data_team',
@@ -45,22 +40,19 @@ def run_kenpom_plot(**context):
     Returns:
         Path to generated plot file
     """
-    # Get the execution date from context
-    execution_date = context.get('execution_date') or context.get('data_interval_start')
+    # In Astro, the include folder is automatically added to PYTHONPATH
+    # So we can directly import from kenpom_plot. The import lives here so
+    # the scheduler doesn't load pandas/plotly every time it parses this file
+    from kenpom_plot import main
+    
+    # Get the logical date from context (execution_date is deprecated)
+    logical_date = context.get('data_interval_start') or context.get('execution_date')
+    default_year = logical_date.year if logical_date else 2026
     
-    # Use current year or execution date year
-    # You can also use a fixed year or get it from Airflow Variables
+    # Use the KENPOM_YEAR Airflow Variable if set, otherwise the logical date's
+    # year (or 2026). default_var means a missing Variable doesn't raise
     from airflow.models import Variable
-    try:
-        # Try to get year from Airflow Variable, fallback to execution year or 2026
-        year_var = Variable.get("KENPOM_YEAR", default_var=None)
-        if year_var:
-            year = int(year_var)
-        else:
-            year = execution_date.year if execution_date else 2026
-    except Exception:
-        # Fallback to execution year or default
-        year = execution_date.year if execution_date else 2026
+    year = int(Variable.get("KENPOM_YEAR", default_var=default_year) or default_year)
     
     # Output to dags/output folder (accessible from local machine since dags/ is mounted)
     output_dir = os.path.join(os.path.dirname(__file__), 'output')
@@ -2,17 +2,17 @@
 KenPom Team Ratings Visualization Script
 Fetches data from KenPom API and creates a Plotly visualization
 """
-import pandas as pd
+import glob
 import os
-import requests
-import numpy as np
-from matplotlib.path import Path as MPLPath
-import plotly.graph_objects as go
+import tempfile
 from dotenv import load_dotenv
 from datetime import datetime
-import plotly.io as pio
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+# pandas, requests and plotly are imported inside the functions that use them
+# so that importing this module (e.g. during Airflow DAG parsing) stays cheap
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,6 +23,197 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Columns the plot needs from the KenPom ratings response, with compact dtypes
+# (float32 is ample precision for plotting)
+RATING_DTYPES = {'TeamName': 'string', 'AdjTempo': 'float32', 'AdjEM': 'float32'}
+
+# Trapezoid outline (AdjTempo, AdjEM), closed back to the first vertex.
+# Built once at import rather than on every create_plot call
+TRAPEZOID_X = (64.5, 70.2, 72, 62.5, 64.5)
+TRAPEZOID_Y = (20, 20, 40, 40, 20)
+
+# Shared HTTP session so repeated fetches reuse pooled keep-alive connections
+_SESSION = None
+
+# Numba-compiled trapezoid test; None until first built, False if numba is unavailable
+_TRAPEZOID_KERNEL = None
+
+# Below this many points the NumPy expression is faster than importing numba
+# and loading/compiling the kernel, so numba is only used for larger inputs
+NUMBA_MIN_POINTS = 10_000
+
+
+def _get_session():
+    """
+    Return the shared HTTP session, creating it on first use
+    
+    Returns:
+        requests.Session with connection pooling and retries configured
+    """
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        _SESSION = requests.Session()
+        _SESSION.headers.update({"Accept": "application/json"})
+        _SESSION.mount("https://", HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+        ))
+    return _SESSION
+
+
+def _get_trapezoid_kernel():
+    """
+    Return the Numba-compiled trapezoid membership kernel, building it on first use
+    
+    Returns:
+        Compiled function (x, y) -> boolean mask, or None if numba is not installed
+    """
+    global _TRAPEZOID_KERNEL
+    if _TRAPEZOID_KERNEL is None:
+        try:
+            import numpy as np
+            from numba import njit, prange
+        except ImportError:
+            logger.info("numba not available, using NumPy for the trapezoid test")
+            _TRAPEZOID_KERNEL = False
+        else:
+            @njit(parallel=True, cache=True)
+            def _in_trap(x, y):
+                # Fuse the four half-plane comparisons into a single pass.
+                # Same arithmetic as _in_trapezoid_numpy so edge points agree
+                n = x.shape[0]
+                out = np.empty(n, dtype=np.bool_)
+                for i in prange(n):
+                    yi = y[i]
+                    t = (yi - 20.0) / 20.0
+                    out[i] = ((yi >= 20.0) & (yi <= 40.0)
+                              & (x[i] >= 64.5 + (62.5 - 64.5) * t)
+                              & (x[i] <= 70.2 + (72.0 - 70.2) * t))
+                return out
+            
+            _TRAPEZOID_KERNEL = _in_trap
+    return _TRAPEZOID_KERNEL or None
+
+
+def _in_trapezoid_numpy(x, y):
+    """
+    NumPy implementation of in_trapezoid for float64 arrays
+    
+    Args:
+        x: Array of AdjTempo values
+        y: Array of AdjEM values
+    
+    Returns:
+        Boolean array, True where the point is inside the trapezoid
+    """
+    t = (y - 20.0) / 20.0
+    left = 64.5 + (62.5 - 64.5) * t
+    right = 70.2 + (72.0 - 70.2) * t
+    return (y >= 20.0) & (y <= 40.0) & (x >= left) & (x <= right)
+
+
+def in_trapezoid(x, y):
+    """
+    Check which points fall inside the Trapezoid of Excellence
+    
+    Trapezoid vertices: (64.5,20), (70.2,20), (72,40), (62.5,40). The shape
+    is fixed, so membership is tested with its four half-planes instead of
+    a general point-in-polygon algorithm. Inputs of NUMBA_MIN_POINTS or more
+    use the Numba kernel when numba is installed. NaN points are outside.
+    
+    Args:
+        x: Array of AdjTempo values
+        y: Array of AdjEM values
+    
+    Returns:
+        Boolean array, True where the point is inside the trapezoid
+    """
+    import numpy as np
+    
+    # Both implementations work in float64 so they round identically
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    if len(x) >= NUMBA_MIN_POINTS:
+        kernel = _get_trapezoid_kernel()
+        if kernel is not None:
+            return kernel(x, y)
+    
+    return _in_trapezoid_numpy(x, y)
+
+
+def _register_plot_template():
+    """
+    Register the static KenPom plot styling as the 'kenpom' Plotly template
+    
+    Only runs the first time it is called, so per-run plotting just
+    references the template instead of rebuilding the layout.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    
+    if 'kenpom' in pio.templates:
+        return
+    
+    axis_style = dict(
+        title=dict(font=dict(size=16, color='black', family='Arial Black')),
+        tickfont=dict(size=12, color='black'),
+        gridcolor='rgba(0,0,0,0.1)',
+        gridwidth=1,
+        showgrid=True,
+        zeroline=False
+    )
+    pio.templates['kenpom'] = go.layout.Template(layout=dict(
+        title=dict(
+            font=dict(size=20, color='#009CDE', family='Arial Black'),
+            x=0.5
+        ),
+        xaxis=axis_style,
+        yaxis=axis_style,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        width=1200,
+        height=800,
+        legend=dict(
+            x=1.02,
+            y=1,
+            bgcolor='white',
+            bordercolor='black',
+            borderwidth=2,
+            font=dict(size=12, color='black', family='Arial')
+        ),
+        hovermode='closest'
+    ))
+
+
+def _write_atomically(path, write, suffix):
+    """
+    Write a file via a uniquely named temp file and rename it into place
+    
+    Readers never see a partially written file, and concurrent runs
+    writing the same path don't share a temp file.
+    
+    Args:
+        path: Final destination path
+        write: Callable that writes the content to the temp path it is given
+        suffix: Temp file suffix (e.g. '.html'), for writers that infer format
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix=suffix)
+    os.close(fd)
+    try:
+        # mkstemp creates the file owner-only; published outputs should be readable
+        os.chmod(tmp_path, 0o644)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 def fetch_kenpom_data(year):
     """
@@ -34,8 +225,20 @@ def fetch_kenpom_data(year):
     Returns:
         DataFrame with team ratings data
     """
+    import orjson
+    import pandas as pd
+    
     BASE_URL = "https://kenpom.com/api.php"
     
+    # Ratings update at most once a day, so reuse today's response on retries/backfills
+    cache_path = os.path.join(
+        tempfile.gettempdir(),
+        f"kenpom_{year}_{datetime.now():%Y%m%d}.parquet"
+    )
+    if os.path.exists(cache_path):
+        logger.info(f"Loading cached KenPom data from {cache_path}")
+        return pd.read_parquet(cache_path, columns=list(RATING_DTYPES))
+    
     # Try to get API key from environment variables first
     API_KEY = os.getenv('KENPOM_API_KEY')
     
@@ -61,32 +264,36 @@ def fetch_kenpom_data(year):
     }
     
     logger.info(f"Fetching KenPom data for year {year}")
-    response = requests.get(
+    response = _get_session().get(
         f"{BASE_URL}?endpoint=ratings&y={year}",
-        headers=headers
+        headers=headers,
+        timeout=(5, 30)
     )
     response.raise_for_status()
     
-    data = response.json()
-    df = pd.DataFrame(data)
+    # Parse with orjson and keep only the columns the plot uses
+    data = orjson.loads(response.content)
+    df = pd.DataFrame.from_records(
+        data, columns=list(RATING_DTYPES)
+    ).astype(RATING_DTYPES)
     logger.info(f"Fetched {len(df)} teams")
     
-    return df
-
-
-def point_in_polygon(point, polygon):
-    """
-    Check if a point is inside a polygon
+    # Write to a temp file and rename so an interrupted run can't leave a
+    # truncated cache file behind
+    _write_atomically(cache_path, df.to_parquet, '.parquet')
     
-    Args:
-        point: Tuple of (x, y) coordinates
-        polygon: Array of polygon vertices
+    # Drop earlier days' cache files for this season so they don't pile up
+    for old_cache_path in glob.glob(
+        os.path.join(tempfile.gettempdir(), f"kenpom_{year}_*.parquet")
+    ):
+        if old_cache_path != cache_path:
+            try:
+                os.remove(old_cache_path)
+            except OSError:
+                # Already removed by a concurrent run, or not ours to delete
+                pass
     
-    Returns:
-        Boolean indicating if point is inside polygon
-    """
-    path = MPLPath(polygon)
-    return path.contains_point(point)
+    return df
 
 
 def create_plot(df, output_path='kenpom_ratings_plot.html'):
@@ -100,47 +307,23 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
     Returns:
         Path to saved plot file
     """
-    # Define trapezoid points: (64.5,20), (70.2,20), (62.5,40), (72,40)
-    trapezoid_points = np.array([
-        [64.5, 20],  # bottom left
-        [70.2, 20],  # bottom right
-        [72, 40],    # top right
-        [62.5, 40]   # top left
-    ])
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    
+    mask = in_trapezoid(df['AdjTempo'].to_numpy(), df['AdjEM'].to_numpy())
     
     # Separate teams inside and outside the trapezoid
-    inside_trapezoid = []
-    outside_trapezoid = []
-    inside_data = []
-    outside_data = []
-    
-    for idx, row in df.iterrows():
-        point = (row['AdjTempo'], row['AdjEM'])
-        if point_in_polygon(point, trapezoid_points):
-            inside_trapezoid.append(idx)
-            inside_data.append({
-                'x': row['AdjTempo'],
-                'y': row['AdjEM'],
-                'name': row['TeamName']
-            })
-        else:
-            outside_trapezoid.append(idx)
-            outside_data.append({
-                'x': row['AdjTempo'],
-                'y': row['AdjEM'],
-                'name': row['TeamName']
-            })
+    inside_df = df.loc[mask]
+    outside_df = df.loc[~mask]
     
-    # Create the plotly figure
-    fig = go.Figure()
+    # Create the plotly figure on top of the default theme plus our styling
+    _register_plot_template()
+    fig = go.Figure(layout_template='plotly+kenpom')
     
     # Add trapezoid shape
-    trapezoid_x = [64.5, 70.2, 72, 62.5, 64.5]  # Close the polygon
-    trapezoid_y = [20, 20, 40, 40, 20]
-    
     fig.add_trace(go.Scatter(
-        x=trapezoid_x,
-        y=trapezoid_y,
+        x=TRAPEZOID_X,
+        y=TRAPEZOID_Y,
         fill='toself',
         fillcolor='rgba(0,0,0,0.1)',
         line=dict(color='black', width=3),
@@ -150,11 +333,11 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
         hoverinfo='skip'
     ))
     
-    # Add points outside the trapezoid (blue dots)
-    if outside_data:
-        fig.add_trace(go.Scatter(
-            x=[d['x'] for d in outside_data],
-            y=[d['y'] for d in outside_data],
+    # Add points outside the trapezoid (blue dots, WebGL-rendered)
+    if not outside_df.empty:
+        fig.add_trace(go.Scattergl(
+            x=outside_df['AdjTempo'].values,
+            y=outside_df['AdjEM'].values,
             mode='markers',
             marker=dict(
                 size=6,
@@ -163,7 +346,7 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
                 opacity=0.6,
                 line=dict(width=0.5, color='#009CDE')
             ),
-            text=[d['name'] for d in outside_data],
+            text=outside_df['TeamName'].values,
             hovertemplate='<b>%{text}</b><br>' +
                           'Tempo: %{x:.1f}<br>' +
                           'AdjEM: %{y:.1f}<extra></extra>',
@@ -172,10 +355,10 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
         ))
     
     # Add points inside the trapezoid (yellow stars)
-    if inside_data:
+    if not inside_df.empty:
         fig.add_trace(go.Scatter(
-            x=[d['x'] for d in inside_data],
-            y=[d['y'] for d in inside_data],
+            x=inside_df['AdjTempo'].values,
+            y=inside_df['AdjEM'].values,
             mode='markers',
             marker=dict(
                 size=10,
@@ -184,7 +367,7 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
                 opacity=0.9,
                 line=dict(width=1, color='orange')
             ),
-            text=[d['name'] for d in inside_data],
+            text=inside_df['TeamName'].values,
             hovertemplate='<b>%{text}</b><br>' +
                           'Tempo: %{x:.1f}<br>' +
                           'AdjEM: %{y:.1f}<extra></extra>',
@@ -192,73 +375,66 @@ def create_plot(df, output_path='kenpom_ratings_plot.html'):
             showlegend=True
         ))
     
-    # Update layout with white theme
+    # Static styling comes from the 'kenpom' template; only set per-run text here
     fig.update_layout(
-        title=dict(
-            text='ROAD TO INDIANAPOLIS\n' \
+        title_text='ROAD TO INDIANAPOLIS\n' \
             'Trapezoid of Excellence',
-            font=dict(size=20, color='#009CDE', family='Arial Black'),
-            x=0.5
-        ),
-        xaxis=dict(
-            title=dict(
-                text='Adjusted Tempo',
-                font=dict(size=16, color='black', family='Arial Black')
-            ),
-            tickfont=dict(size=12, color='black'),
-            gridcolor='rgba(0,0,0,0.1)',
-            gridwidth=1,
-            showgrid=True,
-            zeroline=False
-        ),
-        yaxis=dict(
-            title=dict(
-                text='Adjusted Efficiency Margin',
-                font=dict(size=16, color='black', family='Arial Black')
-            ),
-            tickfont=dict(size=12, color='black'),
-            gridcolor='rgba(0,0,0,0.1)',
-            gridwidth=1,
-            showgrid=True,
-            zeroline=False
-        ),
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        width=1200,
-        height=800,
-        legend=dict(
-            x=1.02,
-            y=1,
-            bgcolor='white',
-            bordercolor='black',
-            borderwidth=2,
-            font=dict(size=12, color='black', family='Arial')
-        ),
-        hovermode='closest'
+        xaxis_title_text='Adjusted Tempo',
+        yaxis_title_text='Adjusted Efficiency Margin'
     )
     
     # Get the directory of output_path for the PNG file
     output_dir = os.path.dirname(output_path) if os.path.dirname(output_path) else '.'
     png_path = os.path.join(output_dir, 'kenpom_ratings.png')
     
-    # Save the HTML plot
-    fig.write_html(output_path)
-    logger.info(f"Plot saved to {output_path}")
+    # PNG export starts a headless Chromium, so only do it when asked for
+    emit_png = os.getenv('KENPOM_EMIT_PNG', '0') == '1'
     
-    # Try to save PNG (requires Chrome/Chromium to be installed)
-    try:
-        pio.write_image(fig, png_path, width=1200, height=800)
-        logger.info(f"PNG saved to {png_path}")
-    except Exception as e:
-        logger.warning(f"Could not save PNG image: {str(e)}")
-        logger.info("HTML plot was saved successfully. PNG export requires Chrome/Chromium to be installed.")
+    # Outputs are written to a temp file and renamed into place so readers
+    # never see a partially written artifact
+    def write_png():
+        _write_atomically(
+            png_path,
+            lambda path: pio.write_image(fig, path, format='png', width=1200, height=800),
+            '.png'
+        )
+    
+    def write_html(path):
+        fig.write_html(
+            path,
+            include_plotlyjs='cdn',
+            full_html=True,
+            include_mathjax=False,
+            auto_open=False
+        )
+    
+    # The PNG export runs in a background thread while the HTML is written,
+    # so the run takes the longer of the two rather than their sum
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        png_future = executor.submit(write_png) if emit_png else None
+        
+        # Save the HTML plot, loading plotly.js from the CDN instead of embedding it
+        _write_atomically(output_path, write_html, '.html')
+        logger.info(f"Plot saved to {output_path}")
+        
+        if png_future is not None:
+            # Try to save PNG (requires Chrome/Chromium to be installed)
+            try:
+                png_future.result()
+                logger.info(f"PNG saved to {png_path}")
+            except Exception as e:
+                logger.warning(f"Could not save PNG image: {str(e)}")
+                logger.info("HTML plot was saved successfully. PNG export requires Chrome/Chromium to be installed.")
     
     # Log summary
-    logger.info(f"Teams inside the trapezoid: {len(inside_trapezoid)}")
-    if inside_trapezoid:
-        logger.info("Highlighted Teams:")
-        for idx in inside_trapezoid:
-            logger.info(f"  - {df.loc[idx, 'TeamName']} (Tempo: {df.loc[idx, 'AdjTempo']:.1f}, AdjEM: {df.loc[idx, 'AdjEM']:.1f})")
+    logger.info(f"Teams inside the trapezoid: {len(inside_df)}")
+    if not inside_df.empty and logger.isEnabledFor(logging.INFO):
+        # Emit the whole list as one record instead of one per team
+        lines = (
+            f"  - {row.TeamName} (Tempo: {row.AdjTempo:.1f}, AdjEM: {row.AdjEM:.1f})"
+            for row in inside_df[['TeamName', 'AdjTempo', 'AdjEM']].itertuples(index=False)
+        )
+        logger.info("Highlighted Teams:\n" + "\n".join(lines))
     
     return output_path
 
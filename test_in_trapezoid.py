@@ -0,0 +1,65 @@
+"""
+Checks that the Numba and NumPy trapezoid tests agree, including edge cases
+"""
+import numpy as np
+import pytest
+
+from kenpom_plot import _get_trapezoid_kernel, _in_trapezoid_numpy, in_trapezoid
+
+EPS = 1e-6
+
+# (AdjTempo, AdjEM) points on and around the trapezoid boundary
+POINTS = [
+    # Vertices
+    (64.5, 20.0), (70.2, 20.0), (72.0, 40.0), (62.5, 40.0),
+    # Midpoints of the slanted edges
+    (63.5, 30.0), (71.1, 30.0),
+    # Just outside each edge
+    (63.5 - EPS, 30.0), (71.1 + EPS, 30.0),
+    (67.0, 20.0 - EPS), (67.0, 40.0 + EPS),
+    # Along the y=20 and y=40 rows
+    (64.5 - EPS, 20.0), (67.0, 20.0), (70.2 + EPS, 20.0),
+    (62.5 - EPS, 40.0), (67.0, 40.0), (72.0 + EPS, 40.0),
+    # Clearly inside / outside
+    (67.0, 30.0), (60.0, 30.0), (75.0, 30.0), (67.0, 10.0), (67.0, 50.0),
+    # Missing data
+    (np.nan, 30.0), (67.0, np.nan), (np.nan, np.nan),
+]
+
+
+def _xy():
+    pts = np.array(POINTS, dtype=np.float64)
+    return pts[:, 0].copy(), pts[:, 1].copy()
+
+
+def test_numpy_expected_values():
+    mask = dict(zip(POINTS[:-3], _in_trapezoid_numpy(*_xy())[:-3]))
+    assert mask[(67.0, 30.0)]
+    assert mask[(63.5, 30.0)]
+    assert mask[(64.5, 20.0)] and mask[(62.5, 40.0)]
+    assert not mask[(63.5 - EPS, 30.0)]
+    assert not mask[(71.1 + EPS, 30.0)]
+    assert not mask[(67.0, 20.0 - EPS)]
+    assert not mask[(67.0, 40.0 + EPS)]
+    assert not mask[(60.0, 30.0)] and not mask[(75.0, 30.0)]
+
+
+def test_nan_is_outside():
+    assert not _in_trapezoid_numpy(*_xy())[-3:].any()
+
+
+def test_numba_kernel_matches_numpy():
+    kernel = _get_trapezoid_kernel()
+    if kernel is None:
+        pytest.skip("numba not installed")
+    x, y = _xy()
+    np.testing.assert_array_equal(kernel(x, y), _in_trapezoid_numpy(x, y))
+
+
+def test_in_trapezoid_accepts_float32():
+    x, y = _xy()
+    np.testing.assert_array_equal(
+        in_trapezoid(x.astype(np.float32), y.astype(np.float32)),
+        _in_trapezoid_numpy(x.astype(np.float32).astype(np.float64),
+                            y.astype(np.float32).astype(np.float64))
+    )